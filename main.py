@@ -1,5 +1,6 @@
 from livekit.plugins import google
 from dotenv import load_dotenv
+from functools import partial
 import os
 from livekit import agents
 from livekit.agents import AgentSession, Agent, RoomInputOptions
@@ -11,18 +12,20 @@ load_dotenv()
 LIVEKIT_ROOM_NAME = os.getenv("LIVEKIT_ROOM_NAME", "cadenza-residence-ai-chat") # Define your room name here
 
 sd.default.device = 10 # Still targeting pulse
+# Ask PortAudio for its smallest device buffers instead of the
+# high-latency defaults; streams opened by the agent's console mode use these
+sd.default.latency = "low"
 # A common block size (can experiment with 512, 2048)
-print(f"Sounddevice set to use device ID: {sd.default.device}, Sample Rate: {sd.default.samplerate}, Block Size: {sd.default.blocksize}")
-# Create a session with Google Gemini
-session_google = AgentSession(
-    llm=google.beta.realtime.RealtimeModel(
-        model="gemini-live-2.5-flash-preview",
-        voice="Puck",
-        temperature=0.8,
-        instructions="You are a helpful assistant",
-        api_key=os.getenv("GEMINI_API_KEY"),
-        modalities=["AUDIO"],
-    ),
+print(f"Sounddevice set to use device ID: {sd.default.device}, Sample Rate: {sd.default.samplerate}, Block Size: {sd.default.blocksize}, Latency: {sd.default.latency}")
+# Google Gemini model settings; each job builds its own model and session
+gemini_realtime_model = partial(
+    google.beta.realtime.RealtimeModel,
+    model="gemini-live-2.5-flash-preview",
+    voice="Puck",
+    temperature=0.8,
+    instructions="You are a helpful assistant",
+    api_key=os.getenv("GEMINI_API_KEY"),
+    modalities=["AUDIO"],
 )
 
 
@@ -35,7 +38,7 @@ class Assistant(Agent):
 
 
 async def entrypoint(ctx: agents.JobContext):
-    session = session_google
+    session = AgentSession(llm=gemini_realtime_model())
 
     await session.start(
         room=ctx.room,
@@ -5,13 +5,19 @@ from pydantic import BaseModel
 from dotenv import load_dotenv
 from livekit import api
 
+from speech_server import lifespan, router as speech_router
+from static_site import register_static
+
 # Load environment variables from .env file
 load_dotenv()
 
+# One app serves the tour, the LiveKit token endpoint and the Gemini speech
+# WebSocket (/ws), so everything runs in a single event-loop process
 app = FastAPI(
-    title="LiveKit Token Server",
-    description="Generates LiveKit Access Tokens for frontend applications.",
+    title="Cadenza Residence Server",
+    description="Serves the virtual tour, LiveKit Access Tokens and Gemini speech.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS (Cross-Origin Resource Sharing)
@@ -33,78 +39,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-import asyncio
-import io
-import os
-import json
-import base64
-import load_dotenv
-import numpy as np
-
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-
-
-
-# --- Configuration ---
-load_dotenv.load_dotenv()
-
 
 # --- Serve Static Files ---
-app.mount("/loading", StaticFiles(directory="loading"), name="loading")
-app.mount("/media", StaticFiles(directory="media"), name="media")
-app.mount("/misc", StaticFiles(directory="misc"), name="misc")
-app.mount("/fonts", StaticFiles(directory="fonts"), name="fonts")
-app.mount("/lib", StaticFiles(directory="lib"), name="lib")
-app.mount("/skin", StaticFiles(directory="skin"), name="skin")
-app.mount("/locale", StaticFiles(directory="locale"), name="locale")
-
-@app.get("/")
-async def get():
-    return HTMLResponse(content=open("index.htm").read(), status_code=200)
-
-@app.get("/manifest.json")
-async def get_manifest():
-    with open("manifest.json", "r") as f:
-        return json.loads(f.read())
-
-@app.get("/fonts.css")
-async def get_fonts_css():
-    with open("fonts.css", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="text/css")
-
-@app.get("/script.js")
-async def get_script_js():
-    with open("script.js", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="application/javascript")
-
-@app.get("/script_general.js")
-async def get_script_general_js():
-    with open("script_general.js", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="application/javascript")
-
-@app.get("/scorm.js")
-async def get_scorm_js():
-    with open("scorm.js", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="application/javascript")
-
-@app.get("/favicon.ico")
-async def get_favicon():
-    with open("favicon.ico", "rb") as f:
-        return HTMLResponse(content=f.read(), media_type="image/x-icon")
+register_static(app)
+
+# --- Gemini Speech WebSocket ---
+app.include_router(speech_router)
 
 # Retrieve LiveKit credentials from environment variables
 LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
 LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 LIVEKIT_URL = os.getenv("LIVEKIT_URL") # e.g., wss://your.livekit.cloud
 
-# Basic validation for environment variables
-if not all([LIVEKIT_API_KEY, LIVEKIT_API_SECRET, LIVEKIT_URL]):
-    raise ValueError(
-        "LIVEKIT_API_KEY, LIVEKIT_API_SECRET, and LIVEKIT_URL "
-        "must be set in the .env file for the token server."
-    )
+# Basic validation for environment variables. Missing LiveKit settings only
+# disable /get-token; the tour and the Gemini speech WebSocket still run.
+LIVEKIT_CONFIGURED = all([LIVEKIT_API_KEY, LIVEKIT_API_SECRET, LIVEKIT_URL])
+LIVEKIT_CONFIG_ERROR = (
+    "LIVEKIT_API_KEY, LIVEKIT_API_SECRET, and LIVEKIT_URL "
+    "must be set in the .env file for the token server."
+)
+if not LIVEKIT_CONFIGURED:
+    print(f"⚠️ {LIVEKIT_CONFIG_ERROR} /get-token is disabled.")
 
 # Pydantic model for request body validation
 class TokenRequest(BaseModel):
@@ -116,6 +71,9 @@ async def get_token(request_data: TokenRequest):
     """
     Generates a LiveKit Access Token for a given room and participant.
     """
+    if not LIVEKIT_CONFIGURED:
+        raise HTTPException(status_code=503, detail=LIVEKIT_CONFIG_ERROR)
+
     room_name = request_data.roomName
     participant_name = request_data.participantName
 
@@ -143,13 +101,21 @@ async def get_token(request_data: TokenRequest):
 
 # You can run this server using Uvicorn:
 # pip install uvicorn
-# uvicorn token_server:app --host 0.0.0.0 --port 8080 --reload
-# (Assuming this file is named token_server.py)
+# uvicorn server:app --host 0.0.0.0 --port 8080 --reload
 
 if __name__ == "__main__":
     import uvicorn
-    print("🚀 Starting SPEECH-enabled Gemini server with OFFICIAL API...")
+    print("🚀 Starting Cadenza Residence server...")
     print("📍 Access at: http://localhost:8080")
-    print("🔊 This server uses the CORRECT Live API implementation!")
-    print("🎵 Voice: Aoede (you can change this in the config)")
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    print("🔊 Gemini speech WebSocket at: ws://localhost:8080/ws")
+    # uvloop + httptools for a faster event loop; per-message deflate is
+    # off because PCM audio does not compress and zlib only adds CPU
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8080,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
+        ws_per_message_deflate=False,
+    )
\ No newline at end of file
@@ -1,27 +1,37 @@
 import asyncio
+import atexit
+import logging
+import logging.handlers
 import os
-import json
-import load_dotenv
+import queue
+import orjson
+from collections import deque
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from functools import lru_cache
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from google import genai
 from google.genai import types
 
 # --- Configuration ---
-load_dotenv.load_dotenv()
+load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable not set.")
 
-# Initialize the GenAI client for speech responses
-client = genai.Client(
-    api_key=GEMINI_API_KEY,
-    http_options={'api_version': 'v1alpha'}
-)
+# The GenAI client for speech responses is created on first use, once per
+# worker process, so importing this module stays cheap. The key is checked
+# here rather than at import so server.py can still issue LiveKit tokens
+# without a Gemini key; only /ws needs one.
+@lru_cache(maxsize=None)
+def get_client():
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY environment variable not set.")
+    return genai.Client(
+        api_key=GEMINI_API_KEY,
+        http_options={'api_version': 'v1alpha'}
+    )
 
 # Use the free model that supports audio output
 model = "gemini-2.0-flash-exp"
@@ -30,180 +40,350 @@ config = types.LiveConnectConfig(
     system_instruction="You are a helpful AI assistant for the Cadenza Residence virtual tour. Respond naturally and conversationally in a friendly tone. Keep responses concise and engaging."
 )
 
-# Initialize FastAPI app
-app = FastAPI()
-
-# --- Serve Static Files ---
-app.mount("/loading", StaticFiles(directory="loading"), name="loading")
-app.mount("/media", StaticFiles(directory="media"), name="media")
-app.mount("/misc", StaticFiles(directory="misc"), name="misc")
-app.mount("/fonts", StaticFiles(directory="fonts"), name="fonts")
-app.mount("/lib", StaticFiles(directory="lib"), name="lib")
-app.mount("/skin", StaticFiles(directory="skin"), name="skin")
-app.mount("/locale", StaticFiles(directory="locale"), name="locale")
-
-@app.get("/")
-async def get():
-    return HTMLResponse(content=open("index.htm").read(), status_code=200)
-
-@app.get("/manifest.json")
-async def get_manifest():
-    with open("manifest.json", "r") as f:
-        return json.loads(f.read())
-
-@app.get("/fonts.css")
-async def get_fonts_css():
-    with open("fonts.css", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="text/css")
-
-@app.get("/script.js")
-async def get_script_js():
-    with open("script.js", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="application/javascript")
-
-@app.get("/script_general.js")
-async def get_script_general_js():
-    with open("script_general.js", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="application/javascript")
-
-@app.get("/scorm.js")
-async def get_scorm_js():
-    with open("scorm.js", "r") as f:
-        return HTMLResponse(content=f.read(), media_type="application/javascript")
-
-@app.get("/favicon.ico")
-async def get_favicon():
-    with open("favicon.ico", "rb") as f:
-        return HTMLResponse(content=f.read(), media_type="image/x-icon")
-
-
-@app.websocket("/ws")
+# --- Logging ---
+# Records are written by a background thread so console I/O never blocks the
+# event loop. Per-frame audio messages are logged at DEBUG, which is only
+# enabled with CADENZA_DEBUG=1.
+logger = logging.getLogger("cadenza")
+logger.setLevel(logging.DEBUG if os.getenv("CADENZA_DEBUG") == "1" else logging.INFO)
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# Max microphone frames buffered per connection before new ones are dropped
+AUDIO_QUEUE_SIZE = 8
+# test_speech.html sends mic audio as 20 ms PCM frames; pairs are merged so
+# Gemini gets requests of at least 40 ms (16 kHz, 16-bit mono), unless the
+# first frame has already waited UPLINK_FLUSH_INTERVAL seconds
+MIN_UPLINK_BYTES = 1280
+UPLINK_FLUSH_INTERVAL = 0.06
+# Max speech chunks from Gemini buffered per connection before reads pause
+SPEECH_QUEUE_SIZE = 64
+# Speech audio is merged into WS frames of at least this size for the client,
+# unless the first chunk has already waited AUDIO_FLUSH_INTERVAL seconds
+MIN_AUDIO_FRAME_BYTES = 16 * 1024
+AUDIO_FLUSH_INTERVAL = 0.02
+
+# Mic audio as captured by test_speech.html's AudioWorklet: raw 16 kHz,
+# 16-bit mono PCM. MediaRecorder WebM/Opus uploads are not accepted.
+AUDIO_INPUT_MIME_TYPE = "audio/pcm;rate=16000"
+# Every WebM stream (MediaRecorder's output) opens with this EBML header
+WEBM_MAGIC = b"\x1a\x45\xdf\xa3"
+
+# Opening line spoken once the Gemini session is ready, built once
+GREETING_TEXT = "Hello! I'm your AI assistant for the Cadenza Residence virtual tour. How can I help you today?"
+
+def user_turn(text):
+    """Wrap text as a user turn for send_client_content."""
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+GREETING_TURN = user_turn(GREETING_TEXT)
+
+# Status frames with a fixed payload, serialized once
+SPEECH_COMPLETE_MESSAGE = orjson.dumps({'type': 'speech_complete'}).decode()
+
+# Gemini sessions kept connected ahead of time so a new visitor skips the
+# TLS + Live API setup handshake. Off (0) unless GEMINI_SESSION_POOL_SIZE is
+# set. An unused session is closed after SESSION_MAX_IDLE seconds, before
+# Gemini drops it for idling, and is not replaced: the pool only refills as
+# visitors arrive, so an idle server stops connecting to Gemini.
+SESSION_POOL_SIZE = int(os.getenv("GEMINI_SESSION_POOL_SIZE", "0"))
+SESSION_MAX_IDLE = 120
+
+
+class GeminiSessionPool:
+    """Warm spare Gemini Live sessions, each handed to a single visitor.
+
+    Sessions are never shared or reused: a Live session keeps the whole
+    conversation, so passing it to the next visitor would leak the previous
+    one's context. The pool only moves the connect handshake off the
+    visitor's critical path. Each session is opened and closed by its own
+    holder task, which parks it in the pool and waits for the visitor to
+    release it.
+    """
+
+    def __init__(self, size, max_idle):
+        self.size = size
+        self.max_idle = max_idle
+        self._ready = deque()  # (session, released event) waiting for a visitor
+        self._connecting = 0
+        self._holders = set()
+
+    def fill(self):
+        """Start connecting sessions until the pool is back to size."""
+        while len(self._ready) + self._connecting < self.size:
+            self._connecting += 1
+            holder = asyncio.create_task(self._hold())
+            self._holders.add(holder)
+            holder.add_done_callback(self._holders.discard)
+
+    async def _hold(self):
+        """Open one session, park it in the pool and close it once released."""
+        released = asyncio.Event()
+        entry = None
+        try:
+            async with get_client().aio.live.connect(model=model, config=config) as session:
+                self._connecting -= 1
+                entry = (session, released)
+                self._ready.append(entry)
+                logger.debug("🔥 Warm Gemini session ready")
+                try:
+                    await asyncio.wait_for(released.wait(), self.max_idle)
+                except TimeoutError:
+                    if entry in self._ready:
+                        self._ready.remove(entry)
+                        return
+                    # Taken just as it expired: keep it open for the visitor
+                    await released.wait()
+        except Exception as e:
+            logger.warning("⚠️ Could not pre-connect Gemini session: %s", e)
+        finally:
+            if entry is None:
+                self._connecting -= 1
+            elif entry in self._ready:
+                self._ready.remove(entry)
+
+    @asynccontextmanager
+    async def session(self):
+        """Yield a connected session for one visitor, warm if one is ready."""
+        if not self._ready:
+            # Refill only once this connect has succeeded, so an unreachable
+            # Gemini costs each visitor a single attempt
+            async with get_client().aio.live.connect(model=model, config=config) as session:
+                self.fill()
+                yield session
+            return
+
+        session, released = self._ready.popleft()
+        self.fill()
+        try:
+            yield session
+        finally:
+            released.set()
+
+    async def close(self):
+        """Close every session still held by the pool."""
+        for holder in self._holders:
+            holder.cancel()
+        await asyncio.gather(*self._holders, return_exceptions=True)
+
+
+session_pool = GeminiSessionPool(SESSION_POOL_SIZE, SESSION_MAX_IDLE)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Pre-connect the first sessions while the server starts listening."""
+    session_pool.fill()
+    yield
+    await session_pool.close()
+
+
+# Mounted by server.py, which runs the single app process
+router = APIRouter()
+
+
+@router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint that returns SPEECH responses from Gemini."""
     await websocket.accept()
-    print(f"🔗 WebSocket connected: {websocket.client}")
+    logger.info("🔗 WebSocket connected: %s", websocket.client)
+
+    # Microphone audio waiting to go up to Gemini; bounded so a slow uplink
+    # drops frames instead of building up latency.
+    in_q = asyncio.Queue(maxsize=AUDIO_QUEUE_SIZE)
+    # Speech audio (bytes) and status frames (str) waiting to go to the client;
+    # bounded so a slow browser pauses reads from Gemini instead of letting
+    # audio pile up in memory.
+    out_q = asyncio.Queue(maxsize=SPEECH_QUEUE_SIZE)
 
     # Connect to Gemini Live API with speech support
     try:
-        async with client.aio.live.connect(model=model, config=config) as session:
-            print("🚀 Connected to Gemini Live API for SPEECH")
-            
-            async def handle_gemini_responses():
-                """Handle speech responses from Gemini."""
+        async with session_pool.session() as session:
+            logger.info("🚀 Connected to Gemini Live API for SPEECH")
+
+            # Sessions are only handed out once Gemini has acknowledged the
+            # setup, so the session is ready to speak the greeting straight away
+            logger.info("👋 Sending greeting for speech: %s", GREETING_TEXT)
+            await session.send_client_content(turns=GREETING_TURN)
+
+            async def handle_client_message(message):
+                """Forward a JSON control message from the client to Gemini."""
                 try:
+                    data = orjson.loads(message)
+                except orjson.JSONDecodeError:
+                    return
+                if not isinstance(data, dict):
+                    return
+                message_type = data.get('type')
+
+                if message_type == 'ai_greeting':
+                    greeting = data.get('message', 'Hello! How can I help you?')
+                    logger.info("👋 Sending custom greeting for speech: %s", greeting)
+                    await session.send_client_content(turns=user_turn(greeting))
+
+                elif message_type == 'user_message':
+                    user_text = data.get('message', '')
+                    logger.info("💬 User message for speech: %s", user_text)
+                    await session.send_client_content(turns=user_turn(user_text))
+
+            async def reader():
+                """Read client frames, queueing audio for the sender."""
+                # A single await wakes on whichever frame type arrives next,
+                # so there is no timeout polling.
+                first_audio = True
+                while True:
+                    msg = await websocket.receive()
+                    if msg["type"] == "websocket.disconnect":
+                        raise WebSocketDisconnect(msg.get("code", 1000))
+
+                    if msg.get("text") is not None:
+                        await handle_client_message(msg["text"])
+
+                    elif msg.get("bytes") is not None:
+                        audio_data = msg["bytes"]
+                        logger.debug("🎤 Received %d bytes of audio", len(audio_data))
+                        # Refuse container streams up front: Gemini would get
+                        # them mislabelled as PCM, and dropping a fragment
+                        # below would corrupt the rest of the stream
+                        if first_audio and audio_data.startswith(WEBM_MAGIC):
+                            logger.warning("⚠️ Client sent WebM audio, closing: expected raw 16 kHz PCM")
+                            await websocket.close(code=1003, reason="Expected raw 16 kHz 16-bit PCM audio")
+                            raise WebSocketDisconnect(1003)
+                        first_audio = False
+                        # Frames must hold whole 16-bit samples: an odd byte
+                        # would shift every later sample in the joined uplink.
+                        # Silent frames still go up: Gemini's VAD needs them
+                        # to detect the end of the user's turn.
+                        if len(audio_data) % 2:
+                            logger.warning("⚠️ Client sent a partial PCM sample, closing")
+                            await websocket.close(code=1003, reason="Expected raw 16 kHz 16-bit PCM audio")
+                            raise WebSocketDisconnect(1003)
+                        if not audio_data:
+                            continue
+                        # Each frame is self-contained PCM, so dropping one
+                        # under load only loses that slice of audio
+                        try:
+                            in_q.put_nowait(audio_data)
+                        except asyncio.QueueFull:
+                            logger.warning("⚠️ Audio uplink behind, dropping frame")
+
+            async def sender():
+                """Send queued microphone audio to Gemini."""
+                loop = asyncio.get_running_loop()
+                while True:
+                    # Merge mic frames into requests of at least MIN_UPLINK_BYTES,
+                    # holding the first frame no longer than UPLINK_FLUSH_INTERVAL
+                    chunks = [await in_q.get()]
+                    size = len(chunks[0])
+                    deadline = loop.time() + UPLINK_FLUSH_INTERVAL
+                    while size < MIN_UPLINK_BYTES:
+                        if not in_q.empty():
+                            chunk = in_q.get_nowait()
+                        else:
+                            try:
+                                chunk = await asyncio.wait_for(in_q.get(), deadline - loop.time())
+                            except TimeoutError:
+                                break
+                        chunks.append(chunk)
+                        size += len(chunk)
+                    audio_data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+                    await session.send_realtime_input(
+                        audio=types.Blob(data=audio_data, mime_type=AUDIO_INPUT_MIME_TYPE)
+                    )
+
+            async def gemini_receiver():
+                """Handle speech responses from Gemini."""
+                # session.receive() ends after each turn, so keep re-entering it
+                while True:
                     async for response in session.receive():
-                        print(f"📨 Received response: {type(response)}")
+                        logger.debug("📨 Received response: %s", type(response))
                         
                         # Handle server content with audio
-                        if hasattr(response, 'server_content') and response.server_content:
-                            server_content = response.server_content
-                            
-                            # Handle model turn with speech audio
-                            if hasattr(server_content, 'model_turn') and server_content.model_turn:
-                                model_turn = server_content.model_turn
-                                
-                                for part in model_turn.parts:
-                                    # Handle speech audio data
-                                    if hasattr(part, 'inline_data') and part.inline_data and part.inline_data.data:
-                                        audio_data = part.inline_data.data
-                                        print(f"🔊 SPEECH AUDIO: {len(audio_data)} bytes")
-                                        
-                                        # Send speech audio to client
-                                        await websocket.send_bytes(audio_data)
-                                        print("✅ Speech sent to client!")
-                                    
-                                    # Also log any text for debugging
-                                    if hasattr(part, 'text') and part.text:
-                                        print(f"💬 Text: {part.text}")
-                            
-                            # Handle turn completion
-                            if hasattr(server_content, 'turn_complete') and server_content.turn_complete:
-                                await websocket.send_text(json.dumps({
-                                    'type': 'speech_complete'
-                                }))
-                                print("✅ Speech turn completed")
-                        
-                        # Handle setup completion
-                        if hasattr(response, 'setup_complete'):
-                            print("🚀 Gemini setup completed - ready for speech!")
-                            
-                            # Send initial greeting for speech
-                            greeting_text = "Hello! I'm your AI assistant for the Cadenza Residence virtual tour. How can I help you today?"
-                            print(f"👋 Sending greeting for speech: {greeting_text}")
-                            
-                            # Send text to get speech response
-                            await session.send(greeting_text)
-                            
-                except Exception as e:
-                    print(f"❌ Error in speech handler: {e}")
-                    import traceback
-                    traceback.print_exc()
-
-            # Start response handler
-            response_task = asyncio.create_task(handle_gemini_responses())
-            
-            # Main message loop
-            while True:
-                try:
-                    # Handle text messages
-                    try:
-                        message = await asyncio.wait_for(websocket.receive_text(), timeout=0.01)
-                        data = json.loads(message)
-                        message_type = data.get('type')
-                        
-                        if message_type == 'ai_greeting':
-                            greeting = data.get('message', 'Hello! How can I help you?')
-                            print(f"👋 Sending custom greeting for speech: {greeting}")
-                            await session.send(greeting)
-                            
-                        elif message_type == 'user_message':
-                            user_text = data.get('message', '')
-                            print(f"💬 User message for speech: {user_text}")
-                            await session.send(user_text)
-                            
-                    except asyncio.TimeoutError:
-                        pass
-                    except json.JSONDecodeError:
-                        pass
-                    
-                    # Handle audio input
-                    try:
-                        audio_data = await asyncio.wait_for(websocket.receive_bytes(), timeout=0.01)
-                        print(f"🎤 Received {len(audio_data)} bytes of audio")
-                        
-                        # Send audio to Gemini for speech response
-                        await session.send(types.LiveClientRealtimeInput(
-                            audio=types.Blob(data=audio_data, mime_type="audio/pcm;rate=16000")
-                        ))
-                        
-                    except asyncio.TimeoutError:
-                        await asyncio.sleep(0.001)
-                        
-                except WebSocketDisconnect:
-                    print("🔌 Client disconnected")
-                    break
-                except Exception as e:
-                    print(f"❌ Error in main loop: {e}")
-                    break
-            
-            # Cleanup
-            response_task.cancel()
+                        server_content = response.server_content
+                        if server_content is None:
+                            continue
+
+                        # Handle model turn with speech audio
+                        model_turn = server_content.model_turn
+                        if model_turn is not None and model_turn.parts:
+                            for part in model_turn.parts:
+                                # Handle speech audio data
+                                inline_data = part.inline_data
+                                if inline_data is not None and inline_data.data:
+                                    audio_data = inline_data.data
+                                    logger.debug("🔊 SPEECH AUDIO: %d bytes", len(audio_data))
+
+                                    # Queue speech audio for the client
+                                    await out_q.put(audio_data)
+
+                                # Also log any text for debugging
+                                if part.text:
+                                    logger.info("💬 Text: %s", part.text)
+
+                        # Handle turn completion
+                        if server_content.turn_complete:
+                            await out_q.put(SPEECH_COMPLETE_MESSAGE)
+                            logger.info("✅ Speech turn completed")
+
+            async def writer():
+                """Send queued speech audio and status frames to the client."""
+                # No socket tuning needed: asyncio (and uvloop) already set
+                # TCP_NODELAY on accepted connections, so frames go out at once.
+                loop = asyncio.get_running_loop()
+                frame = None
+                while True:
+                    if frame is None:
+                        frame = await out_q.get()
+                    if isinstance(frame, str):
+                        await websocket.send_text(frame)
+                        frame = None
+                        continue
+
+                    # Merge audio into frames of at least MIN_AUDIO_FRAME_BYTES,
+                    # holding the first chunk no longer than AUDIO_FLUSH_INTERVAL.
+                    # A status frame (e.g. turn complete) flushes what we have.
+                    chunks = [frame]
+                    size = len(frame)
+                    frame = None
+                    deadline = loop.time() + AUDIO_FLUSH_INTERVAL
+                    while size < MIN_AUDIO_FRAME_BYTES:
+                        if not out_q.empty():
+                            frame = out_q.get_nowait()
+                        else:
+                            try:
+                                frame = await asyncio.wait_for(out_q.get(), deadline - loop.time())
+                            except TimeoutError:
+                                break
+                        if isinstance(frame, str):
+                            break
+                        chunks.append(frame)
+                        size += len(frame)
+                        frame = None
+                    # A lone chunk goes out as-is; a burst is joined in one copy
+                    if len(chunks) == 1:
+                        await websocket.send_bytes(chunks[0])
+                    else:
+                        await websocket.send_bytes(b"".join(chunks))
+
+            # Upload and download run independently so a stall in one
+            # direction cannot block the other. The task group cancels the
+            # rest as soon as one task fails (normally the reader raising
+            # WebSocketDisconnect), so nothing outlives the connection.
             try:
-                await response_task
-            except asyncio.CancelledError:
-                pass
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(reader())
+                    tg.create_task(sender())
+                    tg.create_task(gemini_receiver())
+                    tg.create_task(writer())
+            except* WebSocketDisconnect:
+                logger.info("🔌 Client disconnected")
                 
     except Exception as e:
-        print(f"❌ Error in WebSocket handler: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in WebSocket handler: %s", e)
     finally:
-        print("🔚 WebSocket session ended")
-
+        logger.info("🔚 WebSocket session ended")
 
-if __name__ == "__main__":
-    import uvicorn
-    print("🚀 Starting SPEECH-enabled Gemini server...")
-    print("📍 Access at: http://localhost:8085")
-    print("🔊 This server will return SPEECH responses from Gemini!")
-    uvicorn.run(app, host="0.0.0.0", port=8085)
\ No newline at end of file
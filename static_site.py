@@ -0,0 +1,105 @@
+import hashlib
+import os
+
+from fastapi import APIRouter, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+
+
+# --- Serve Static Files ---
+# Compress text assets (the tour's JS alone is several MB); images, video
+# and HLS segments are already compressed and may be range-requested
+COMPRESSIBLE_SUFFIXES = (".js", ".css", ".json", ".htm", ".html", ".txt", ".svg", ".m3u8", "/")
+
+class TextGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that only compresses text assets."""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].endswith(COMPRESSIBLE_SUFFIXES):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Let browsers reuse tour assets between visits instead of re-downloading
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+
+def weak_etag(etag):
+    """Mark an ETag weak, for bodies that may also be sent gzipped."""
+    return etag if etag.startswith("W/") else "W/" + etag
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that adds a Cache-Control header to every file it serves.
+
+    Files TextGZipMiddleware may compress get a weak ETag, the same rule as
+    the cached pages below.
+    """
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+        etag = response.headers.get("etag")
+        if etag and scope["path"].endswith(COMPRESSIBLE_SUFFIXES):
+            response.headers["ETag"] = weak_etag(etag)
+        return response
+
+# Asset folders exported by 3DVista, served as-is
+STATIC_DIRECTORIES = ["loading", "media", "misc", "fonts", "lib", "skin", "locale"]
+# Top-level files the tour loads by URL. Each gets its own route onto one
+# StaticFiles app rather than mounting the project root, which would also
+# expose .env and the server sources.
+ROOT_FILES = ["manifest.json", "fonts.css", "script.js", "script_general.js", "scorm.js", "favicon.ico"]
+
+# --- Static Page Cache ---
+# Pages are kept in memory, each with an ETag for revalidation. The ETag is
+# weak because TextGZipMiddleware may send the page gzipped, so the bytes on
+# the wire differ per encoding. A stat per request picks up edits to the file
+# (e.g. a re-exported tour) without a restart; the file is only re-read when
+# its mtime changes.
+class CachedPage:
+    """A file served from memory, reloaded when it changes on disk."""
+    def __init__(self, path, media_type):
+        self.path = path
+        self.media_type = media_type
+        self.mtime_ns = None
+        self.content = b""
+        self.etag = ""
+        self.load()
+
+    def load(self):
+        """Re-read the file if it changed since the last load."""
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns == self.mtime_ns:
+            return
+        with open(self.path, "rb") as f:
+            self.content = f.read()
+        self.etag = weak_etag('"%s"' % hashlib.blake2b(self.content, digest_size=8).hexdigest())
+        self.mtime_ns = mtime_ns
+
+INDEX_PAGE = CachedPage("index.htm", "text/html")
+
+def _page_response(request, page):
+    """Return a cached page, or a bodiless 304 if the client already has it."""
+    page.load()
+    headers = {"ETag": page.etag}
+    # Weak comparison: W/"x" and "x" name the same page version
+    if_none_match = request.headers.get("if-none-match", "")
+    opaque_tag = page.etag.removeprefix("W/")
+    if opaque_tag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.content, media_type=page.media_type, headers=headers)
+
+router = APIRouter()
+
+@router.get("/")
+async def get(request: Request):
+    return _page_response(request, INDEX_PAGE)
+
+
+def register_static(app):
+    """Serve the tour's asset folders and top-level pages from app."""
+    app.add_middleware(TextGZipMiddleware, minimum_size=1024, compresslevel=6)
+    for directory in STATIC_DIRECTORIES:
+        app.mount(f"/{directory}", CachedStaticFiles(directory=directory), name=directory)
+    root_files = CachedStaticFiles(directory=".")
+    for name in ROOT_FILES:
+        app.add_route(f"/{name}", root_files, include_in_schema=False)
+    app.include_router(router)